@@ -1,8 +1,11 @@
 import os
 import re
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 from graphviz import Digraph
+from graphviz.quoting import quote
 from dotenv import load_dotenv
 
 
@@ -18,106 +21,346 @@ try:
 except ImportError:
     GOOGLE_AI_AVAILABLE = False
 
-def get_module_code(module_name: str, full_verilog_text: str) -> str:
-    """Extracts the full text of a single Verilog module from a file."""
-    module_regex = re.compile(
-        r'^\s*module\s+' + re.escape(module_name) + r'[\s\S]*?endmodule',
-        re.DOTALL | re.MULTILINE
-    )
-    match = module_regex.search(full_verilog_text)
-    return match.group(0) if match else None
+GEMINI_MODEL = 'gemini-1.5-flash'
+GEMINI_CACHE_TTL = 86400
+LARGE_NETLIST_GATES = 50
 
-def get_module_names(verilog_text: str) -> list:
-    """Finds all module names in a Verilog file."""
-    return re.findall(r'^\s*module\s+(\w+)', verilog_text, re.MULTILINE)
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
-def get_ports_for_testbench(module_name: str, verilog_text: str) -> tuple:
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+
+GEMINI_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.gemini_cache')
+
+_MODULE_SCAN_RE = re.compile(r'//[^\n]*|/\*.*?(?:\*/|\Z)|\b(endmodule|module)\b', re.DOTALL)
+_COMMENT_RE = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_WHITESPACE_RE = re.compile(r'\s+')
+_JSON_BLOCK_RE = re.compile(r'\{.*\}', re.DOTALL)
+_VERILOG_FENCE_RE = re.compile(r'```[^\n]*\n(.*?)(?:```|\Z)', re.DOTALL)
+_PORT_DECL_RE = re.compile(r'(input|output|inout)\b\s*(?:(?:reg|wire)\b\s*)?(\[[^\]]+\])?\s*(.+)')
+
+def _strip_comments(code: str) -> str:
+    """Replaces `//` and `/* */` comments with a single space."""
+    return _COMMENT_RE.sub(' ', code)
+
+def _index_modules(text: str) -> list:
+    """Scans the Verilog text once and returns a (name, start, end) tuple for every module."""
+    modules = []
+    length = len(text)
+    current = None
+    for token in _MODULE_SCAN_RE.finditer(text):
+        keyword = token.group(1)
+        if keyword is None:
+            continue  # a comment; skipped as a whole
+
+        pos = token.start()
+        if current is not None:
+            if keyword == 'endmodule':
+                modules.append((current[0], current[1], token.end()))
+                current = None
+            continue
+        if keyword != 'module':
+            continue
+
+        name_start = token.end()
+        # Like the old `^\s*module` anchor: the keyword must be the first token on its line.
+        line_start = text.rfind('\n', 0, pos) + 1
+        if text[line_start:pos].strip() or name_start >= length or not text[name_start].isspace():
+            continue
+
+        while name_start < length and text[name_start].isspace():
+            name_start += 1
+        name_end = name_start
+        while name_end < length and (text[name_end].isalnum() or text[name_end] in '_$'):
+            name_end += 1
+        if name_end > name_start:
+            current = (text[name_start:name_end], pos)
+    return modules
+
+def _content_hash(data: bytes) -> str:
+    """Returns a short, stable digest used to key the parse caches."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+@st.cache_data(show_spinner=False)
+def _cached_module_index(text_hash: str, _verilog_text: str) -> dict:
+    index = {}
+    for name, start, end in _index_modules(_verilog_text):
+        index.setdefault(name, (start, end))
+    return index
+
+def _balanced_span(text: str, open_pos: int) -> int:
+    """Returns the index just past the bracket that closes the one at `open_pos`, or -1 if unbalanced."""
+    depth = 0
+    for i in range(open_pos, len(text)):
+        ch = text[i]
+        if ch in '([{':
+            depth += 1
+        elif ch in ')]}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return -1
+
+def _split_top_level(text: str) -> list:
+    """Splits a port list on commas that are not nested inside brackets."""
+    parts, depth, last = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch in '([{':
+            depth += 1
+        elif ch in ')]}':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(text[last:i])
+            last = i + 1
+    parts.append(text[last:])
+    return parts
+
+def _parse_ports(header: str) -> tuple:
+    """Extracts input/output ports from an ANSI-style module header (everything up to the first ';')."""
+    open_pos = header.find('(')
+    if open_pos == -1: return [], []
+    if header[:open_pos].rstrip().endswith('#'):
+        param_end = _balanced_span(header, open_pos)
+        open_pos = header.find('(', param_end) if param_end != -1 else -1
+        if open_pos == -1: return [], []
+    close_pos = _balanced_span(header, open_pos)
+    if close_pos == -1: return [], []
+
+    inputs, outputs = [], []
+    direction, width = None, ''
+    for token in _split_top_level(header[open_pos + 1:close_pos - 1]):
+        token = token.strip()
+        if not token:
+            continue
+        decl = _PORT_DECL_RE.match(token)
+        if decl:
+            direction, width, name = decl.group(1), decl.group(2) or '', decl.group(3).strip()
+        elif direction:
+            name = token
+        else:
+            continue
+
+        port_info = f"{width.strip()} {name}".strip()
+        if direction == 'input':
+            inputs.append(port_info)
+        elif direction == 'output':
+            outputs.append(port_info)
+    return inputs, outputs
+
+@st.cache_data(show_spinner=False)
+def _cached_ports(text_hash: str, module_name: str, _verilog_text: str) -> tuple:
+    bounds = get_module_index(_verilog_text, text_hash).get(module_name)
+    if not bounds: return [], []
+    start, end = bounds
+    module_code = _strip_comments(_verilog_text[start:end])
+    header_end = module_code.find(';')
+    return _parse_ports(module_code[:header_end] if header_end != -1 else module_code)
+
+def get_module_index(verilog_text: str, text_hash: str = None) -> dict:
+    """Returns a {module_name: (start, end)} map, re-scanning only when the file content changes."""
+    if text_hash is None:
+        text_hash = _content_hash(verilog_text.encode('utf-8'))
+    return _cached_module_index(text_hash, verilog_text)
+
+def get_ports_for_testbench(module_name: str, verilog_text: str, text_hash: str = None) -> tuple:
     """Extracts detailed input/output ports for a specific module."""
+    if text_hash is None:
+        text_hash = _content_hash(verilog_text.encode('utf-8'))
     try:
-        module_regex = re.compile(r'module\s+' + re.escape(module_name) + r'\s*#?\s*\(([\s\S]*?)\);', re.DOTALL | re.IGNORECASE)
-        module_match = module_regex.search(verilog_text)
-        if not module_match: return [], []
-
-        ports_text = module_match.group(1)
-        inputs, outputs = [], []
-
-        port_regex = re.compile(r'(input|output)\s*(?:reg|wire)?\s*(\[[^\]]+\])?\s*([\w\s,]+?)(?=(?:,?\s*(?:input|output|inout|$)))')
-
-        for p_type, p_width, p_names in port_regex.findall(ports_text + "\n"):
-            names = [name.strip() for name in p_names.strip().split(',') if name.strip()]
-            for name in names:
-                port_info = f"{p_width.strip() if p_width else ''} {name}"
-                if p_type == 'input':
-                    inputs.append(port_info.strip())
-                else:
-                    outputs.append(port_info.strip())
-        return inputs, outputs
+        return _cached_ports(text_hash, module_name, verilog_text)
     except Exception:
         return [], []
 
-def ask_gemini_for_gate_level_netlist(module_code: str) -> dict:
+def _prompt_key(prompt: str) -> str:
+    """Returns the cache key for a Gemini prompt."""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+def _normalize_verilog(code: str) -> str:
+    """Strips comments and collapses whitespace so cosmetically different copies of a module share a cache key."""
+    return _WHITESPACE_RE.sub(' ', _strip_comments(code)).strip()
+
+@st.cache_resource
+def _get_gemini_cache():
+    """Opens the on-disk Gemini result cache once per process, or returns None when diskcache is not installed."""
+    return diskcache.Cache(GEMINI_CACHE_DIR) if DISKCACHE_AVAILABLE else None
+
+def _cache_get(key: str):
+    """Looks up a previous Gemini result, returning None on a miss or when caching is unavailable."""
+    cache = _get_gemini_cache()
+    if cache is None:
+        return None
+    return cache.get(key)
+
+def _cache_set(key: str, value) -> None:
+    """Stores a Gemini result so identical prompts skip the API round-trip."""
+    cache = _get_gemini_cache()
+    if cache is not None:
+        cache.set(key, value, expire=GEMINI_CACHE_TTL)
+
+SYNTHESIS_INSTRUCTION = """
+You are an expert logic synthesis tool. Your task is to analyze the Verilog module you are given and convert it into a detailed gate-level netlist.
+**Instructions:**
+1.  Identify all inputs, outputs, and internal wires.
+2.  Decompose all `assign` statements and logic into primitive gates: `and`, `or`, `not`, `xor`, `nand`, `nor`, `xnor`.
+3.  Generate a response in a single, valid JSON object format. Do not add any text or markdown formatting before or after the JSON block.
+4.  The JSON object must have three keys: "inputs", "outputs", and "gates".
+    -   "inputs": A list of strings with the names of all input ports.
+    -   "outputs": A list of strings with the names of all output ports.
+    -   "gates": A list of all synthesized gates. Each gate is a compact positional array `[type, output, [inputs...]]`: the gate type (e.g., 'and', 'or'), the wire this gate drives, and a list of wires connected to the gate's inputs.
+5.  For a statement like `assign y = a & b;`, you would identify 'a' and 'b' as inputs, 'y' as an output, and create the gate: ["and", "y", ["a", "b"]].
+6.  Handle multi-bit buses by treating each bit as a separate wire (e.g., `a[0]`, `a[1]`).
+"""
+
+TESTBENCH_INSTRUCTION = """
+Act as a VLSI verification expert. Generate a complete Verilog testbench for the module you are given.
+**Requirements:**
+1. Use the requested testbench module name.
+2. Instantiate the DUT.
+3. If 'clk' exists, generate a clock. If 'rst' exists, apply a reset.
+4. Apply at least 5 distinct test vectors with a 10ns delay.
+5. Use `$display` to show inputs/outputs for each vector.
+6. End with `$finish`.
+"""
+
+def _get_gemini_model(system_instruction: str):
+    """Returns a model with the static instruction sent as its system instruction.
+
+    The preambles are a few hundred tokens, far below the minimum size Gemini accepts for explicit
+    context caching, so no CachedContent is created for them.
+    """
+    return genai.GenerativeModel(GEMINI_MODEL, system_instruction=system_instruction)
+
+def _stream_text(model, prompt: str, on_chunk=None) -> str:
+    """Streams a Gemini response, reporting the text received so far to `on_chunk` after every chunk."""
+    response = model.generate_content(prompt, stream=True)
+    parts = []
+    for chunk in response:
+        parts.append(chunk.text)
+        if on_chunk:
+            on_chunk(''.join(parts))
+    return ''.join(parts)
+
+def _expand_gates(raw_gates: list) -> tuple:
+    """Rehydrates compact `[type, output, [inputs]]` gates into the dicts used by the diagram code.
+
+    Returns the expanded gates and the raw entries that could not be interpreted.
+    """
+    if not isinstance(raw_gates, list):
+        return [], [raw_gates]
+
+    gates, skipped = [], []
+    for gate in raw_gates:
+        if isinstance(gate, dict):
+            gate_type, gate_output, gate_inputs = gate.get("type"), gate.get("output"), gate.get("inputs", [])
+        elif isinstance(gate, list) and len(gate) == 3:
+            gate_type, gate_output, gate_inputs = gate
+        else:
+            skipped.append(gate)
+            continue
+
+        if isinstance(gate_inputs, str):
+            gate_inputs = [gate_inputs]
+        if (isinstance(gate_type, str) and isinstance(gate_output, str) and isinstance(gate_inputs, list)
+                and all(isinstance(g_input, str) for g_input in gate_inputs)):
+            gates.append({"type": gate_type, "output": gate_output, "inputs": gate_inputs})
+        else:
+            skipped.append(gate)
+    return gates, skipped
+
+def ask_gemini_for_gate_level_netlist(module_code: str, on_chunk=None) -> dict:
     """Asks Gemini to synthesize Verilog into a detailed, gate-level JSON netlist."""
     if not GOOGLE_AI_AVAILABLE:
         return {"error": "Google AI is not configured. Please set GOOGLE_API_KEY in .env."}
 
     prompt = f"""
-    You are an expert logic synthesis tool. Your task is to analyze the following Verilog module and convert it into a detailed gate-level netlist.
-    **Instructions:**
-    1.  Identify all inputs, outputs, and internal wires.
-    2.  Decompose all `assign` statements and logic into primitive gates: `and`, `or`, `not`, `xor`, `nand`, `nor`, `xnor`.
-    3.  Generate a response in a single, valid JSON object format. Do not add any text or markdown formatting before or after the JSON block.
-    4.  The JSON object must have three keys: "inputs", "outputs", and "gates".
-        -   "inputs": A list of strings with the names of all input ports.
-        -   "outputs": A list of strings with the names of all output ports.
-        -   "gates": A list of all synthesized gates. Each gate is an object with "type" (e.g., 'and', 'or'), "output" (the wire this gate drives), and "inputs" (a list of wires connected to the gate's inputs).
-    5.  For a statement like `assign y = a & b;`, you would identify 'a' and 'b' as inputs, 'y' as an output, and create a gate object: {{"type": "and", "output": "y", "inputs": ["a", "b"]}}.
-    6.  Handle multi-bit buses by treating each bit as a separate wire (e.g., `a[0]`, `a[1]`).
     **Verilog Code to Synthesize:**
     ```verilog
     {module_code}
     ```
     **Output JSON:**
     """
+    cache_key = _prompt_key(SYNTHESIS_INSTRUCTION + _normalize_verilog(module_code))
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-        json_text = response.text.strip().lstrip("```json").rstrip("```")
-        return json.loads(json_text)
+        model = _get_gemini_model(SYNTHESIS_INSTRUCTION)
+        response_text = _stream_text(model, prompt, on_chunk)
+        json_match = _JSON_BLOCK_RE.search(response_text)
+        if not json_match:
+            raise ValueError("no JSON object found in the response")
+        netlist = _json_loads(json_match.group(0).encode('utf-8'))
+        netlist["gates"], skipped_gates = _expand_gates(netlist.get("gates", []))
+        if skipped_gates:
+            netlist["skipped_gates"] = skipped_gates
+        _cache_set(cache_key, netlist)
+        return netlist
     except (json.JSONDecodeError, AttributeError, Exception) as e:
         return {"error": f"Failed to get a valid JSON response from the AI. The AI response may have been malformed. Details: {e}"}
 
-def generate_testbench_with_gemini(module_name: str, inputs: list, outputs: list) -> str:
+@st.cache_resource
+def _get_worker_pool() -> ThreadPoolExecutor:
+    """Returns a worker pool for Gemini calls and Graphviz renders that survives Streamlit reruns."""
+    return ThreadPoolExecutor(max_workers=8)
+
+def synthesize_modules(module_codes: list) -> list:
+    """Synthesizes several modules concurrently, returning their netlists in the same order."""
+    return list(_get_worker_pool().map(ask_gemini_for_gate_level_netlist, module_codes))
+
+def generate_testbench_with_gemini(module_name: str, inputs: list, outputs: list, on_chunk=None) -> str:
     """Uses Google Gemini to generate a Verilog testbench."""
     if not GOOGLE_AI_AVAILABLE: return "// Google AI is not configured. Please set GOOGLE_API_KEY in .env."
 
     prompt = f"""
-    Act as a VLSI verification expert. Generate a complete Verilog testbench for the module `{module_name}`.
+    **Module:** `{module_name}`
+    **Testbench module name:** `{module_name}_tb`
     **Inputs:** {', '.join(inputs) or 'None'}
     **Outputs:** {', '.join(outputs) or 'None'}
-    **Requirements:**
-    1. Module name: `{module_name}_tb`.
-    2. Instantiate the DUT.
-    3. If 'clk' exists, generate a clock. If 'rst' exists, apply a reset.
-    4. Apply at least 5 distinct test vectors with a 10ns delay.
-    5. Use `$display` to show inputs/outputs for each vector.
-    6. End with `$finish`.
     """
+    cache_key = _prompt_key(TESTBENCH_INSTRUCTION + prompt)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-        code = response.text.strip()
-        if '```verilog' in code:
-            code = code.split('```verilog')[1].split('```')[0].strip()
+        model = _get_gemini_model(TESTBENCH_INSTRUCTION)
+        code = _stream_text(model, prompt, on_chunk)
+        fence_match = _VERILOG_FENCE_RE.search(code)
+        code = fence_match.group(1).strip() if fence_match else code.strip()
+        _cache_set(cache_key, code)
         return code
     except Exception as e:
         return f"// Gemini API call for testbench failed: {e}"
 
+DIAGRAM_COLORS = {
+    'input': '#C1FFC1',
+    'output': '#FFDDC1',
+    'gate': '#C1DDFF',
+    'wire': '#E0E0E0'
+}
+
+_DOT_STYLE = (
+    '\tnode [fontname=Helvetica fontsize=10 shape=box style="filled,rounded"]\n'
+    '\tedge [arrowhead=vee arrowsize=0.7]\n'
+)
+_DOT_HEADER = '\tbgcolor=transparent nodesep=0.6 rankdir=LR ranksep=1.2 splines=ortho\n' + _DOT_STYLE
+_DOT_HEADER_LARGE = '\tbgcolor=transparent concentrate=true nodesep=0.6 rankdir=LR ranksep=1.2 splines=polyline\n' + _DOT_STYLE
+
 def create_gate_level_diagram(netlist: dict) -> Digraph:
     """Draws a gate-level diagram from a JSON netlist."""
-    dot = Digraph()
-    dot.attr(rankdir='LR', splines='ortho', ranksep='1.2', nodesep='0.6', bgcolor='transparent')
-    dot.attr('node', shape='box', style='filled,rounded', fontname='Helvetica', fontsize='10')
-    dot.attr('edge', arrowhead='vee', arrowsize='0.7')
+    # strict is only a backstop: every edge already goes through the deduplicated `edges` set below.
+    dot = Digraph(engine='dot', strict=True)
+    # The orthogonal edge router dominates render time on big netlists, so fall back to polylines with merged edges.
+    is_large = len(netlist.get("gates", [])) >= LARGE_NETLIST_GATES
+    dot.body.append(_DOT_HEADER_LARGE if is_large else _DOT_HEADER)
 
     if "error" in netlist:
         dot.node("error", f"Error:\n{netlist['error']}", shape="box", style="filled", fillcolor="#FFCCCC")
@@ -125,51 +368,72 @@ def create_gate_level_diagram(netlist: dict) -> Digraph:
 
     all_nodes = set()
 
-  
-    colors = {
-        'input': '#C1FFC1',   
-        'output': '#FFDDC1',  
-        'gate': '#C1DDFF',    
-        'wire': '#E0E0E0'      
-    }
-
     with dot.subgraph(name='cluster_inputs') as c:
         c.attr(label='Inputs', style='rounded', color='gray')
         for port in netlist.get("inputs", []):
-            c.node(port, label=port, shape='ellipse', fillcolor=colors['input'])
+            c.node(port, label=port, shape='ellipse', fillcolor=DIAGRAM_COLORS['input'])
             all_nodes.add(port)
 
     with dot.subgraph(name='cluster_outputs') as c:
         c.attr(label='Outputs', style='rounded', color='gray')
         for port in netlist.get("outputs", []):
-            c.node(port, label=port, shape='ellipse', fillcolor=colors['output'])
+            c.node(port, label=port, shape='ellipse', fillcolor=DIAGRAM_COLORS['output'])
             all_nodes.add(port)
 
+    lines = []
+    edges = set()
     for i, gate in enumerate(netlist.get("gates", [])):
         gate_type = gate.get("type", "gate").upper()
         gate_id = f"gate_{i}_{gate_type.lower()}"
         gate_output = gate.get("output")
         gate_inputs = gate.get("inputs", [])
 
-        dot.node(gate_id, label=gate_type, fillcolor=colors['gate'])
+        lines.append(f'\t{quote(gate_id)} [label={quote(gate_type)} fillcolor="{DIAGRAM_COLORS["gate"]}"]\n')
         if gate_output:
-            dot.edge(gate_id, gate_output)
+            edge = (gate_id, gate_output)
+            if edge not in edges:
+                edges.add(edge)
+                lines.append(f'\t{quote(gate_id)} -> {quote(gate_output)}\n')
             all_nodes.add(gate_output)
         for g_input in gate_inputs:
-            dot.edge(g_input, gate_id)
+            edge = (g_input, gate_id)
+            if edge not in edges:
+                edges.add(edge)
+                lines.append(f'\t{quote(g_input)} -> {quote(gate_id)}\n')
             all_nodes.add(g_input)
-            
- 
+    dot.body.extend(lines)
+
+    input_set = set(netlist.get("inputs", []))
+    output_set = set(netlist.get("outputs", []))
+    gate_outputs = {gate.get("output") for gate in netlist.get("gates", []) if gate.get("output")}
     for node in all_nodes:
-        if node not in netlist.get("inputs", []) and node not in netlist.get("outputs", []):
-            is_gate_output = any(gate.get("output") == node for gate in netlist.get("gates", []))
-       
-            if not is_gate_output:
-                 dot.node(node, label=node, shape='point', width='0.01', color='gray')
+        if node not in input_set and node not in output_set and node not in gate_outputs:
+            dot.node(node, label=node, shape='point', width='0.01', color='gray')
 
     return dot
 
 
+@st.cache_data(show_spinner=False)
+def _render_png(netlist_json: str) -> bytes:
+    """Renders a netlist to PNG, memoized on its canonical JSON so an unchanged diagram skips Graphviz."""
+    return create_gate_level_diagram(json.loads(netlist_json)).pipe(format='png')
+
+def show_diagram(module_name: str, diagram: Digraph, netlist: dict, png_data: bytes) -> None:
+    """Displays a synthesized diagram, its netlist and a PNG download."""
+    if netlist.get("skipped_gates"):
+        st.warning(f"⚠️ Skipped {len(netlist['skipped_gates'])} malformed gate(s) in the AI response; see the netlist JSON below.")
+    st.graphviz_chart(diagram, use_container_width=True)
+    with st.expander("🔬 View AI-Generated Netlist (JSON)"):
+        st.json(netlist)
+    st.download_button(
+        label="📥 Download Diagram (PNG)",
+        data=png_data,
+        file_name=f'{module_name}_diagram.png',
+        mime='image/png',
+        use_container_width=True,
+        key=f"download_{module_name}"
+    )
+
 
 st.set_page_config(
     page_title="Verilog AI Assistant",
@@ -207,6 +471,10 @@ st.markdown("---")
 
 if 'verilog_code' not in st.session_state:
     st.session_state.verilog_code = ""
+    st.session_state.verilog_hash = None
+    st.session_state.module_index = {}
+    st.session_state.uploaded_id = None
+    st.session_state.ports = {}
 
 
 with st.sidebar:
@@ -217,7 +485,17 @@ with st.sidebar:
         help="Upload a Verilog (.v) or SystemVerilog (.sv) file to get started."
     )
     if uploaded_file:
-        st.session_state.verilog_code = uploaded_file.read().decode('utf-8', errors='ignore')
+        uploaded_id = (getattr(uploaded_file, 'file_id', None), uploaded_file.name, uploaded_file.size)
+        if st.session_state.uploaded_id != uploaded_id:
+            raw_bytes = uploaded_file.getvalue()
+            st.session_state.uploaded_id = uploaded_id
+            st.session_state.verilog_hash = _content_hash(raw_bytes)
+            st.session_state.verilog_code = raw_bytes.decode('utf-8', errors='ignore')
+            st.session_state.module_index = get_module_index(st.session_state.verilog_code, st.session_state.verilog_hash)
+            st.session_state.ports = {
+                name: get_ports_for_testbench(name, st.session_state.verilog_code, st.session_state.verilog_hash)
+                for name in st.session_state.module_index
+            }
         st.success(f"✅ Loaded `{uploaded_file.name}`")
 
 
@@ -227,7 +505,7 @@ if not st.session_state.verilog_code:
         st.info("👋 Welcome! Please upload a Verilog file using the sidebar to begin.")
         st.image("[https://i.imgur.com/kZ1hL6D.png](https://i.imgur.com/kZ1hL6D.png)", caption="Upload a file to start the magic!", use_column_width=True)
 else:
-    module_names = get_module_names(st.session_state.verilog_code)
+    module_names = list(st.session_state.module_index)
 
     if not module_names:
         st.warning("⚠️ No Verilog modules found in the uploaded file. Please check the file's content and format.")
@@ -240,42 +518,67 @@ else:
                 module_names,
                 key="module_select"
             )
+            generate_all = st.checkbox(
+                "Generate for all modules",
+                help="Synthesize every module in the file concurrently instead of only the selected one."
+            )
             st.markdown("---")
 
 
         tab1, tab2 = st.tabs(["**✨ Gate-Level Diagram**", "**🧪 Testbench Generator**"])
 
         with tab1:
-            st.header(f"Gate-Level Diagram for `{selected_module}`")
-            st.markdown("Click the button below to let the AI synthesize your module into a detailed gate-level circuit diagram.")
-            
-            if st.button(f"🚀 Generate Diagram for `{selected_module}`", type="primary", use_container_width=True):
-                if not GOOGLE_AI_AVAILABLE:
-                    st.error("❌ Google API key not configured. Please set `GOOGLE_API_KEY` in your environment.")
-                else:
-                    with st.spinner(f"🧠 AI is synthesizing `{selected_module}`... This might take a moment."):
-                        module_code = get_module_code(selected_module, st.session_state.verilog_code)
-                        if module_code:
-                            netlist = ask_gemini_for_gate_level_netlist(module_code)
+            if generate_all:
+                st.header("Gate-Level Diagrams for all modules")
+                st.markdown("Click the button below to let the AI synthesize every module in the file at once.")
+
+                if st.button(f"🚀 Generate Diagrams for {len(module_names)} modules", type="primary", use_container_width=True):
+                    if not GOOGLE_AI_AVAILABLE:
+                        st.error("❌ Google API key not configured. Please set `GOOGLE_API_KEY` in your environment.")
+                    else:
+                        with st.spinner(f"🧠 AI is synthesizing {len(module_names)} modules... This might take a moment."):
+                            module_codes = [st.session_state.verilog_code[start:end] for start, end in st.session_state.module_index.values()]
+                            netlists = synthesize_modules(module_codes)
+
+                        pool = _get_worker_pool()
+                        results = []
+                        for name, netlist in zip(module_names, netlists):
+                            if "error" in netlist:
+                                results.append((name, None, netlist, None))
+                            else:
+                                diagram = create_gate_level_diagram(netlist)
+                                results.append((name, diagram, netlist, pool.submit(_render_png, json.dumps(netlist, sort_keys=True))))
+
+                        for name, diagram, netlist, png_future in results:
+                            st.subheader(f"`{name}`")
+                            if diagram is None:
+                                st.error(f"**AI Synthesis Error:** {netlist['error']}")
+                            else:
+                                show_diagram(name, diagram, netlist, png_future.result())
+            else:
+                st.header(f"Gate-Level Diagram for `{selected_module}`")
+                st.markdown("Click the button below to let the AI synthesize your module into a detailed gate-level circuit diagram.")
+
+                if st.button(f"🚀 Generate Diagram for `{selected_module}`", type="primary", use_container_width=True):
+                    if not GOOGLE_AI_AVAILABLE:
+                        st.error("❌ Google API key not configured. Please set `GOOGLE_API_KEY` in your environment.")
+                    else:
+                        with st.spinner(f"🧠 AI is synthesizing `{selected_module}`... This might take a moment."):
+                            start, end = st.session_state.module_index[selected_module]
+                            module_code = st.session_state.verilog_code[start:end]
+                            progress = st.empty()
+                            netlist = ask_gemini_for_gate_level_netlist(
+                                module_code,
+                                on_chunk=lambda text: progress.caption(f"📡 Received {len(text):,} characters of netlist...")
+                            )
+                            progress.empty()
                             if "error" in netlist:
                                 st.error(f"**AI Synthesis Error:** {netlist['error']}")
                             else:
                                 st.success("✅ Synthesis complete! Here is your diagram.")
                                 diagram = create_gate_level_diagram(netlist)
-                                st.graphviz_chart(diagram, use_container_width=True)
-
-                                png_data = diagram.pipe(format='png')
-                                st.download_button(
-                                    label="📥 Download Diagram (PNG)",
-                                    data=png_data,
-                                    file_name=f'{selected_module}_diagram.png',
-                                    mime='image/png',
-                                    use_container_width=True
-                                )
-                                with st.expander("🔬 View AI-Generated Netlist (JSON)"):
-                                    st.json(netlist)
-                        else:
-                            st.error(f"❌ Could not extract the code for module `{selected_module}`.")
+                                png_data = _render_png(json.dumps(netlist, sort_keys=True))
+                                show_diagram(selected_module, diagram, netlist, png_data)
 
         with tab2:
             st.header(f"Testbench Generator for `{selected_module}`")
@@ -286,13 +589,18 @@ else:
                     st.error("❌ Google API key not configured. Please set `GOOGLE_API_KEY` in your environment.")
                 else:
                     with st.spinner(f"✍️ AI is writing the testbench for `{selected_module}`..."):
-                        inputs, outputs = get_ports_for_testbench(selected_module, st.session_state.verilog_code)
+                        inputs, outputs = st.session_state.ports[selected_module]
                         if not inputs and not outputs:
                             st.warning(f"⚠️ Could not automatically parse I/O ports for `{selected_module}`. The generated testbench might be incomplete.")
                         
-                        tb_code = generate_testbench_with_gemini(selected_module, inputs, outputs)
-                        st.success("✅ Testbench generated successfully!")
-                        st.code(tb_code, language='verilog', line_numbers=True)
+                        status_placeholder = st.empty()
+                        code_placeholder = st.empty()
+                        tb_code = generate_testbench_with_gemini(
+                            selected_module, inputs, outputs,
+                            on_chunk=lambda text: code_placeholder.code(text, language='verilog')
+                        )
+                        status_placeholder.success("✅ Testbench generated successfully!")
+                        code_placeholder.code(tb_code, language='verilog', line_numbers=True)
 
                         st.download_button(
                             label="💾 Download Testbench File",